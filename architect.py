@@ -10,12 +10,58 @@ Architect CLI Tool - Generate technical design documents using Anthropic API
 """
 
 import argparse
+import hashlib
+import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, List
+from typing import TYPE_CHECKING, Dict, Iterator, Optional, List, Tuple
 import re
-import anthropic
+import shutil
+import time
+
+# anthropic is slow to import, so it is only imported once a request is about to be made
+if TYPE_CHECKING:
+    import anthropic
+
+# Tagged sections extracted from the technical design response
+SECTION_TAGS = ("architecture_planning", "technical_design_document", "updated_markdown")
+
+# Output section extraction pattern (all sections in a single pass)
+_ALL_TAGS_RE = re.compile(
+    r'<(architecture_planning|technical_design_document|updated_markdown)>(.*?)</\1>',
+    re.DOTALL
+)
+
+# Slug emitted at the start of the technical design response
+_SLUG_RE = re.compile(r'<slug>(.*?)</slug>', re.DOTALL)
+
+# Minimum seconds between streaming progress messages
+PROGRESS_INTERVAL = 0.5
+
+# Directory that generated documents are written to
+SPECS_DIR = Path("specs")
+
+# On-disk cache for slugs and technical designs generated from identical inputs
+CACHE_DIR = Path.home() / ".cache" / "architect"
+CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Slug cleaning patterns
+_SLUG_STRIP = re.compile(r'[^\w\s-]')
+_SLUG_JOIN = re.compile(r'[-\s]+')
+
+# Local slug extraction: candidate words and the filler words to skip
+_SLUG_WORD = re.compile(r'[a-z]{3,}')
+_SLUG_STOPWORDS = frozenset({
+    'the', 'and', 'for', 'with', 'system', 'user', 'users', 'this', 'that', 'from',
+    'into', 'onto', 'are', 'was', 'were', 'will', 'would', 'should', 'could', 'can',
+    'has', 'have', 'had', 'not', 'but', 'all', 'any', 'each', 'our', 'your', 'their',
+    'its', 'which', 'who', 'what', 'when', 'where', 'how', 'also', 'allow', 'allows',
+    'able', 'using', 'use', 'via', 'new', 'build', 'create', 'need', 'needs', 'want',
+    'feature', 'features', 'application', 'app', 'support', 'supports', 'based',
+})
 
 
 def main():
@@ -29,6 +75,8 @@ Examples:
   architect -f features.md -c context.md
   architect -f features.md -c context.md -e existing1.md existing2.md
   architect -f "user auth" -k "sk-..."
+  architect -f features.md -c context.md --batch
+  architect -f features.md -c context.md --no-cache
         """
     )
     
@@ -54,6 +102,18 @@ Examples:
         help="Anthropic API key (overrides ANTHROPIC_API_KEY env var)"
     )
     
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Submit requests via the Message Batches API (half price, waits for completion)"
+    )
+    
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignore cached slugs and designs and always call the API"
+    )
+    
     args = parser.parse_args()
     
     try:
@@ -64,27 +124,46 @@ Examples:
         features = process_input(args.features, "features")
         context = process_input(args.context, "context") if args.context else ""
         existing_content = process_existing_files(args.existing) if args.existing else ""
+        updated_paths = updated_output_paths(args.existing) if args.existing else []
+        use_cache = not args.no_cache
         
-        # Generate slug
-        print("Generating system slug...")
-        slug = generate_slug(api_key, features)
-        print(f"Generated slug: {slug}")
-        
-        # Generate technical design
-        print("Generating technical design document...")
-        response = generate_technical_design(api_key, features, context, existing_content)
-        
-        # Parse and save outputs
-        parse_and_save_outputs(response, slug, args.existing)
+        if not args.batch:
+            # Generate technical design, saving each section as soon as it is complete.
+            # The slug is emitted at the start of the same response.
+            print("Generating technical design document...")
+            slug = ""
+            sections = {}
+            for tag, content in generate_technical_design(api_key, features, context, existing_content, use_cache):
+                if tag == "slug":
+                    # Sections already saved under a fallback slug keep their file names
+                    if not slug:
+                        slug = resolve_slug(clean_slug(content), api_key, features, use_cache)
+                    continue
+                
+                if not slug:
+                    slug = resolve_slug("", api_key, features, use_cache)
+                sections[tag] = content
+                save_section(tag, content, slug, updated_paths)
+            
+            if not slug:
+                slug = resolve_slug("", api_key, features, use_cache)
+            warn_missing_sections(sections)
+        else:
+            # Generate technical design in a batch, taking the slug from the start of its response
+            print("Submitting technical design batch...")
+            response = generate_with_batch(api_key, features, context, existing_content, use_cache)
+            slug_match = _SLUG_RE.search(response)
+            slug = resolve_slug(clean_slug(slug_match.group(1)) if slug_match else "", api_key, features, use_cache)
+            
+            # Parse and save outputs
+            parse_and_save_outputs(response, slug, updated_paths)
         
         print(f"✅ Generated files in specs/ directory:")
         print(f"  - specs/{slug}_architecture_planning.md")
         print(f"  - specs/{slug}_technical_design.md")
         
-        if args.existing:
-            for existing_file in args.existing:
-                filename = Path(existing_file).name
-                print(f"  - specs/updated_{filename}")
+        for updated_path in updated_paths:
+            print(f"  - {updated_path.as_posix()}")
                 
     except Exception as e:
         print(f"❌ Error: {e}", file=sys.stderr)
@@ -105,15 +184,31 @@ def resolve_api_key(cli_key: Optional[str]) -> str:
     )
 
 
+@lru_cache(maxsize=None)
+def get_client(api_key: str) -> "anthropic.Anthropic":
+    """Create the Anthropic client on first use, sharing it (and its connection pool) across requests"""
+    import anthropic
+    return anthropic.Anthropic(api_key=api_key)
+
+
+def fast_read_text(path: Path) -> str:
+    """Read a UTF-8 text file with a single read sized to the file"""
+    return path.read_bytes().decode('utf-8')
+
+
 def process_input(input_value: str, input_type: str) -> str:
     """Process input value - either direct string or file path"""
-    if input_value.endswith('.md') and Path(input_value).exists():
+    # Only try to open values that could be a path (single line, shorter than PATH_MAX)
+    if input_value.endswith('.md') and len(input_value) < 4096 and '\n' not in input_value:
         try:
-            return Path(input_value).read_text(encoding='utf-8')
+            return fast_read_text(Path(input_value))
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            # Not a file, so treat it as a literal string
+            pass
         except Exception as e:
             raise ValueError(f"Error reading {input_type} file '{input_value}': {e}")
-    else:
-        return input_value
+    
+    return input_value
 
 
 def process_existing_files(existing_files: List[str]) -> str:
@@ -121,75 +216,187 @@ def process_existing_files(existing_files: List[str]) -> str:
     if not existing_files:
         return ""
     
-    combined_content = []
     for file_path in existing_files:
-        path = Path(file_path)
-        if not path.exists():
-            raise ValueError(f"Existing file not found: {file_path}")
-        
         if not file_path.endswith('.md'):
             raise ValueError(f"Existing file must be a .md file: {file_path}")
-        
-        try:
-            content = path.read_text(encoding='utf-8')
-            combined_content.append(f"File: {file_path}\n{content}")
-        except Exception as e:
-            raise ValueError(f"Error reading existing file '{file_path}': {e}")
     
-    return "\n\n".join(combined_content)
+    # Read all files concurrently so their I/O overlaps
+    with ThreadPoolExecutor(max_workers=min(len(existing_files), 8)) as executor:
+        contents = list(executor.map(read_existing_file, existing_files))
+    
+    return "\n\n".join(
+        f"File: {file_path}\n{content}" for file_path, content in zip(existing_files, contents)
+    )
+
+
+def read_existing_file(file_path: str) -> str:
+    """Read a single existing markdown file"""
+    try:
+        return fast_read_text(Path(file_path))
+    except FileNotFoundError:
+        raise ValueError(f"Existing file not found: {file_path}")
+    except Exception as e:
+        raise ValueError(f"Error reading existing file '{file_path}': {e}")
+
+
+def slug_request_params(features: str) -> dict:
+    """Build the request parameters for slug generation"""
+    return {
+        "model": "claude-3-5-haiku-latest",
+        "max_tokens": 8,
+        "temperature": 0.1,
+        "stop_sequences": ["\n"],
+        "messages": [
+            {
+                "role": "user",
+                "content": f"Generate a 1-3 word slug (underscore_separated) for this system: {features[:500]} \n Remember to only return the slug without any additional text."
+            },
+            {
+                # Prefill so the model continues directly with the slug
+                "role": "assistant",
+                "content": "slug:"
+            }
+        ]
+    }
+
+
+def slug_from_response(message: "anthropic.types.Message") -> str:
+    """Extract the slug from a prefilled slug generation response"""
+    words = message.content[0].text.split() if message.content else []
+    if not words:
+        raise ValueError("model returned an empty slug")
+    return clean_slug(words[0])
+
+
+def clean_slug(slug: str) -> str:
+    """Clean up slug to ensure it's valid for filenames"""
+    slug = _SLUG_STRIP.sub('', slug.strip())
+    slug = _SLUG_JOIN.sub('_', slug)
+    return slug.lower()
+
+
+def local_slug(features: str) -> Optional[str]:
+    """Derive a slug from the first meaningful words of the features, without an API call"""
+    words = [
+        word for word in _SLUG_WORD.findall(features[:200].lower())
+        if word not in _SLUG_STOPWORDS
+    ]
+    return "_".join(words[:3]) or None
+
+
+def cache_key(value: str) -> str:
+    """Hash a cache lookup value"""
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def load_cached_slug(key: str) -> Optional[str]:
+    """Return a cached slug if present and not expired"""
+    try:
+        entry = json.loads((CACHE_DIR / "slugs.json").read_text(encoding='utf-8'))[key]
+        if time.time() - entry["created"] < CACHE_MAX_AGE:
+            return entry["slug"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def save_cached_slug(key: str, slug: str):
+    """Store a slug in the cache, ignoring cache write failures"""
+    slugs_file = CACHE_DIR / "slugs.json"
+    try:
+        slugs = json.loads(slugs_file.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        slugs = {}
+    
+    slugs[key] = {"slug": slug, "created": time.time()}
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        write_cache_file(slugs_file, json.dumps(slugs))
+    except OSError:
+        pass
+
+
+def load_cached_design(key: str) -> Optional[str]:
+    """Return a cached technical design response if present and not expired"""
+    design_file = CACHE_DIR / "designs" / f"{key}.txt"
+    try:
+        if time.time() - design_file.stat().st_mtime < CACHE_MAX_AGE:
+            return fast_read_text(design_file)
+    except OSError:
+        pass
+    return None
+
+
+def save_cached_design(key: str, response: str):
+    """Store a technical design response in the cache, ignoring cache write failures"""
+    try:
+        (CACHE_DIR / "designs").mkdir(parents=True, exist_ok=True)
+        write_cache_file(CACHE_DIR / "designs" / f"{key}.txt", response)
+    except OSError:
+        pass
+
+
+def lookup_cached_design(params: dict, use_cache: bool) -> Tuple[str, Optional[str]]:
+    """Return the cache key for a design request and its cached response, if any"""
+    # Identical inputs, prompt and model produce a reusable response, whether it
+    # was generated by streaming or in a batch
+    key = cache_key(json.dumps(params, sort_keys=True))
+    cached_response = load_cached_design(key) if use_cache else None
+    if cached_response is not None:
+        print("♻️  Using cached technical design for identical inputs")
+    return key, cached_response
+
+
+def write_cache_file(path: Path, text: str):
+    """Write a cache file atomically, so readers never see a partially written entry"""
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        temp_path.write_text(text, encoding='utf-8')
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
 
 
-def generate_slug(api_key: str, features: str) -> str:
+def resolve_slug(slug: str, api_key: str, features: str, use_cache: bool = True) -> str:
+    """Use the slug from the response, falling back to a local or separate slug request"""
+    slug = slug or local_slug(features) or generate_slug(api_key, features, use_cache)
+    print(f"Generated slug: {slug}")
+    return slug
+
+
+def generate_slug(api_key: str, features: str, use_cache: bool = True) -> str:
     """Generate a slug using Anthropic API"""
-    client = anthropic.Anthropic(api_key=api_key)
+    # The slug prompt only sees the first 500 characters of the features
+    key = cache_key(features[:500])
+    if use_cache:
+        cached_slug = load_cached_slug(key)
+        if cached_slug:
+            return cached_slug
     
     try:
-        message = client.messages.create(
-            model="claude-3-5-haiku-latest",
-            max_tokens=50,
-            temperature=0.1,
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"Generate a 1-3 word slug (underscore_separated) for this system: {features[:500]} \n Remember to only return the slug without any additional text."
-                }
-            ]
-        )
-        
-        slug = message.content[0].text.strip()
-        # Clean up slug to ensure it's valid for filenames
-        slug = re.sub(r'[^\w\s-]', '', slug)
-        slug = re.sub(r'[-\s]+', '_', slug)
-        return slug.lower()
+        message = get_client(api_key).messages.create(**slug_request_params(features))
+        slug = slug_from_response(message)
         
     except Exception as e:
         raise ValueError(f"Error generating slug: {e}")
+    
+    save_cached_slug(key, slug)
+    return slug
 
 
-def generate_technical_design(api_key: str, features: str, context: str, existing_content: str) -> str:
-    """Generate technical design document using Anthropic API"""
-    client = anthropic.Anthropic(api_key=api_key)
-    
-    system_prompt = """You are a Sr. Software Architect. Your role is to ensure a complete, thorough, simple and elegant design is captured before implementation begins."""
-    
-    user_prompt = f"""As a Sr. Software Architect, your task is to create a comprehensive technical design document for a software system. This document should describe the architecture, technical requirements, implementation considerations, and other relevant details for implementing the system.
+# Technical design prompts. The system prompt and instructions are constant so they
+# can be served from the prompt cache; only the trailing inputs block varies per run.
+DESIGN_SYSTEM_PROMPT = """You are a Sr. Software Architect. Your role is to ensure a complete, thorough, simple and elegant design is captured before implementation begins."""
 
-Before we begin, here is the necessary information for your task:
+DESIGN_INSTRUCTIONS_PROMPT = """Start your response with a 1-3 word slug (underscore_separated) identifying the system, inside <slug></slug> tags.
 
-1. Feature Descriptions:
-<feature_descriptions>
-{features}
-</feature_descriptions>
+As a Sr. Software Architect, your task is to create a comprehensive technical design document for a software system. This document should describe the architecture, technical requirements, implementation considerations, and other relevant details for implementing the system.
 
-2. Technical Context:
-<technical_context>
-{context}
-</technical_context>
+The necessary information for your task is provided at the end of this message:
 
-3. Existing Markdown (if available):
-<existing_markdown>
-{existing_content}
-</existing_markdown>
+1. Feature Descriptions, inside <feature_descriptions> tags
+2. Technical Context, inside <technical_context> tags
+3. Existing Markdown (if available), inside <existing_markdown> tags
 
 Please follow these steps to create the technical design document:
 
@@ -291,36 +498,158 @@ If you've updated any existing markdown content, include it here:
 </updated_markdown>
 
 Remember to focus on major architectural and project-level design decisions. Your final output should include the content within the <architecture_planning> thinking block, <technical_design_document> and <updated_markdown> tags."""
+
+DESIGN_INPUTS_TEMPLATE = """Here is the necessary information for your task:
+
+1. Feature Descriptions:
+<feature_descriptions>
+{features}
+</feature_descriptions>
+
+2. Technical Context:
+<technical_context>
+{context}
+</technical_context>
+
+3. Existing Markdown (if available):
+<existing_markdown>
+{existing_content}
+</existing_markdown>"""
+
+
+def design_request_params(features: str, context: str, existing_content: str) -> dict:
+    """Build the request parameters for technical design generation"""
+    inputs_prompt = DESIGN_INPUTS_TEMPLATE.format_map({
+        "features": features,
+        "context": context,
+        "existing_content": existing_content
+    })
+    
+    return {
+        "model": "claude-opus-4-20250514",
+        "max_tokens": 20000,
+        "temperature": 0.2,
+        "system": [
+            {
+                "type": "text",
+                "text": DESIGN_SYSTEM_PROMPT,
+                "cache_control": {"type": "ephemeral"}
+            }
+        ],
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": DESIGN_INSTRUCTIONS_PROMPT,
+                        "cache_control": {"type": "ephemeral"}
+                    },
+                    {
+                        "type": "text",
+                        "text": inputs_prompt
+                    }
+                ]
+            }
+        ]
+    }
+
+
+class SectionStreamParser:
+    """Incrementally extract tagged sections from a streamed response"""
+    
+    def __init__(self, tags: Tuple[str, ...] = SECTION_TAGS):
+        self.sections: Dict[str, str] = {}
+        # Tags are ASCII, so they can be matched on the raw UTF-8 bytes
+        self._pending = {tag: (f"<{tag}>".encode('ascii'), f"</{tag}>".encode('ascii')) for tag in tags}
+        self._buffer = bytearray()
+        self._content_offsets: Dict[str, int] = {}
+        self._last_scan_offset = 0
+        # Rescan enough already-scanned bytes to catch tags straddling chunk boundaries
+        self._overlap = max(len(close_tag) for _, close_tag in self._pending.values())
+    
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """Append a chunk and return the sections whose closing tag it completed"""
+        self._buffer += text.encode('utf-8')
+        
+        # Opening and closing tags can only complete in a chunk containing '>'
+        if '>' not in text or not self._pending:
+            return []
+        
+        # Only scan bytes received since the previous scan
+        scan_start = max(self._last_scan_offset - self._overlap, 0)
+        self._last_scan_offset = len(self._buffer)
+        
+        completed = []
+        for tag, (open_tag, close_tag) in list(self._pending.items()):
+            start = self._content_offsets.get(tag)
+            if start is None:
+                index = self._buffer.find(open_tag, scan_start)
+                if index == -1:
+                    continue
+                start = self._content_offsets[tag] = index + len(open_tag)
+            
+            end = self._buffer.find(close_tag, max(start, scan_start))
+            if end == -1:
+                continue
+            
+            # Only the section payload is decoded back to text
+            self.sections[tag] = self._buffer[start:end].decode('utf-8').strip()
+            del self._pending[tag]
+            completed.append((tag, self.sections[tag]))
+        
+        return completed
+    
+    def getvalue(self) -> str:
+        """Return the full response received so far"""
+        return self._buffer.decode('utf-8')
+
+
+def generate_technical_design(
+    api_key: str,
+    features: str,
+    context: str,
+    existing_content: str,
+    use_cache: bool = True
+) -> Iterator[Tuple[str, str]]:
+    """Generate technical design document using Anthropic API
+    
+    Yields (tag, content) for the slug and each section as soon as its closing tag is streamed.
+    """
+    params = design_request_params(features, context, existing_content)
+    parser = SectionStreamParser(("slug",) + SECTION_TAGS)
+    
+    key, cached_response = lookup_cached_design(params, use_cache)
+    if cached_response is not None:
+        yield from parser.feed(cached_response)
+        return
     
     try:
         # Use streaming for long-running requests
         print("🔄 Generating technical design (streaming)...")
         
-        with client.messages.stream(
-            model="claude-opus-4-20250514",
-            max_tokens=20000,
-            temperature=0.2,
-            system=system_prompt,
-            messages=[
-                {
-                    "role": "user",
-                    "content": user_prompt
-                }
-            ]
-        ) as stream:
-            response_text = ""
+        with get_client(api_key).messages.stream(**params) as stream:
             chunk_count = 0
+            last_progress = time.monotonic()
             
             for text in stream.text_stream:
-                response_text += text
+                yield from parser.feed(text)
                 chunk_count += 1
                 
-                # Show progress every 100 chunks for less spam
-                if chunk_count % 100 == 0:
-                    print(f"📝 Processing... ({chunk_count} chunks received)")
-                    sys.stdout.flush()  # Force output to appear immediately
+                # Show progress at most every half second for less spam
+                now = time.monotonic()
+                if now - last_progress > PROGRESS_INTERVAL:
+                    last_progress = now
+                    print(f"📝 Processing... ({chunk_count} chunks received)", flush=True)
+            
+            stop_reason = stream.get_final_message().stop_reason
         
         print(f"✅ Streaming complete ({chunk_count} chunks received)")
+        response_text = parser.getvalue()
+        
+        # Only cache complete responses, not ones truncated by max_tokens
+        if stop_reason == "end_turn":
+            save_cached_design(key, response_text)
         
         # Log the entire response
         print(f"📝 Full LLM Response:")
@@ -328,8 +657,6 @@ Remember to focus on major architectural and project-level design decisions. You
         print(response_text)
         print("=" * 80)
         
-        return response_text
-        
     except Exception as e:
         if "stream" in str(e).lower():
             raise ValueError(f"Error in streaming response: {e}")
@@ -337,39 +664,152 @@ Remember to focus on major architectural and project-level design decisions. You
             raise ValueError(f"Error generating technical design: {e}")
 
 
-def parse_and_save_outputs(response: str, slug: str, existing_files: Optional[List[str]]):
-    """Parse API response and save outputs to files"""
+def generate_with_batch(
+    api_key: str,
+    features: str,
+    context: str,
+    existing_content: str,
+    use_cache: bool = True
+) -> str:
+    """Generate technical design using a Message Batches request"""
+    params = design_request_params(features, context, existing_content)
     
-    # Create specs directory if it doesn't exist
-    specs_dir = Path("specs")
-    specs_dir.mkdir(exist_ok=True)
-    
-    # Extract architecture planning
-    planning_match = re.search(r'<architecture_planning>(.*?)</architecture_planning>', response, re.DOTALL)
-    if planning_match:
-        planning_content = planning_match.group(1).strip()
-        (specs_dir / f"{slug}_architecture_planning.md").write_text(planning_content, encoding='utf-8')
-    else:
-        print("⚠️  Warning: No architecture planning section found in response")
+    key, cached_response = lookup_cached_design(params, use_cache)
+    if cached_response is not None:
+        return cached_response
     
-    # Extract technical design document
-    design_match = re.search(r'<technical_design_document>(.*?)</technical_design_document>', response, re.DOTALL)
-    if design_match:
-        design_content = design_match.group(1).strip()
-        (specs_dir / f"{slug}_technical_design.md").write_text(design_content, encoding='utf-8')
-    else:
-        print("⚠️  Warning: No technical design document section found in response")
+    from anthropic.types.message_create_params import MessageCreateParamsNonStreaming
+    from anthropic.types.messages.batch_create_params import Request
+    
+    client = get_client(api_key)
+    requests = [
+        Request(
+            custom_id="design",
+            params=MessageCreateParamsNonStreaming(**params)
+        )
+    ]
     
-    # Extract updated markdown (if any)
-    updated_match = re.search(r'<updated_markdown>(.*?)</updated_markdown>', response, re.DOTALL)
-    if updated_match and existing_files:
-        updated_content = updated_match.group(1).strip()
+    try:
+        batch = client.messages.batches.create(requests=requests)
+        print(f"🔄 Submitted batch {batch.id}, waiting for completion...")
+        
+        # Poll with exponential backoff until the batch has ended
+        delay = 1
+        while batch.processing_status != "ended":
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+            batch = client.messages.batches.retrieve(batch.id)
+            print(f"📝 Batch {batch.processing_status}... ({batch.request_counts.processing} requests processing)", flush=True)
+        
+        outputs = {}
+        for entry in client.messages.batches.results(batch.id):
+            if entry.result.type != "succeeded":
+                raise ValueError(f"request '{entry.custom_id}' {entry.result.type}")
+            outputs[entry.custom_id] = entry.result.message
         
+    except Exception as e:
+        raise ValueError(f"Error in batch request: {e}")
+    
+    print("✅ Batch complete")
+    
+    # Log the entire response
+    print("📝 Full LLM Response:")
+    print("=" * 80)
+    response = outputs["design"].content[0].text
+    print(response)
+    print("=" * 80)
+    
+    # Only cache complete responses, not ones truncated by max_tokens
+    if outputs["design"].stop_reason == "end_turn":
+        save_cached_design(key, response)
+    
+    return response
+
+
+def updated_output_paths(existing_files: List[str]) -> List[Path]:
+    """Compute the output path of the updated copy of each existing file"""
+    # Files with the same name map to the same output, so list each path once
+    return list(dict.fromkeys(SPECS_DIR / f"updated_{Path(existing_file).name}" for existing_file in existing_files))
+
+
+def section_outputs(tag: str, content: str, slug: str, updated_paths: List[Path]) -> Tuple[List[Path], str]:
+    """List the output files for an extracted section, which all receive its content"""
+    if tag == "architecture_planning":
+        return [SPECS_DIR / f"{slug}_architecture_planning.md"], content
+    if tag == "technical_design_document":
+        return [SPECS_DIR / f"{slug}_technical_design.md"], content
+    if tag == "updated_markdown":
         # For simplicity, save all updated content to each existing file
         # In a more sophisticated implementation, you'd parse individual file updates
-        for existing_file in existing_files:
-            filename = Path(existing_file).name
-            (specs_dir / f"updated_{filename}").write_text(updated_content, encoding='utf-8')
+        return updated_paths, content
+    return [], content
+
+
+def write_outputs(outputs: List[Tuple[List[Path], str]]):
+    """Write each section's output files, concurrently when there is more than one"""
+    outputs = [(paths, content) for paths, content in outputs if paths]
+    if not outputs:
+        return
+    
+    # Create specs directory if it doesn't exist
+    SPECS_DIR.mkdir(exist_ok=True)
+    
+    if len(outputs) == 1:
+        write_output(*outputs[0])
+    else:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            # Consume the results so that write errors are raised here
+            list(executor.map(lambda output: write_output(*output), outputs))
+
+
+def write_output(paths: List[Path], content: str):
+    """Write content to the first path and hard link the remaining paths to it"""
+    # Replace existing files rather than writing through them, so files hard linked
+    # together by a previous run are not changed along with them
+    for path in paths:
+        path.unlink(missing_ok=True)
+    
+    paths[0].write_text(content, encoding='utf-8')
+    for target in paths[1:]:
+        link_output(paths[0], target)
+
+
+def link_output(source: Path, target: Path):
+    """Hard link an output file, copying instead where hard links are unsupported"""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def save_section(tag: str, content: str, slug: str, updated_paths: List[Path]):
+    """Save a single extracted section to its output file(s)"""
+    write_outputs([section_outputs(tag, content, slug, updated_paths)])
+
+
+def warn_missing_sections(sections: Dict[str, str]):
+    """Warn about required sections missing from the response"""
+    if "architecture_planning" not in sections:
+        print("⚠️  Warning: No architecture planning section found in response")
+    if "technical_design_document" not in sections:
+        print("⚠️  Warning: No technical design document section found in response")
+
+
+def parse_and_save_outputs(response: str, slug: str, updated_paths: List[Path]):
+    """Parse API response and save outputs to files"""
+    
+    # Extract all tagged sections in one scan, keeping the first occurrence of each
+    sections = {}
+    for match in _ALL_TAGS_RE.finditer(response):
+        sections.setdefault(match.group(1), match.group(2).strip())
+    
+    # Write every section's files together so they are written concurrently
+    write_outputs([
+        section_outputs(tag, content, slug, updated_paths)
+        for tag, content in sections.items()
+    ])
+    
+    warn_missing_sections(sections)
 
 
 if __name__ == "__main__":
@@ -30,6 +30,9 @@ while [[ $# -gt 0 ]]; do
             echo "  --no-cache                      Force rebuild of container image"
             echo "  --permission-mode MODE          Set permission mode (default, acceptEdits, plan, bypassPermissions)"
             echo "  -h, --help                     Show this help message"
+            echo ""
+            echo "Environment:"
+            echo "  DOCKER_CACHE_REPO               Registry repository to import/export the base image layer cache"
             exit 0
             ;;
         *)
@@ -48,6 +51,7 @@ IMAGE_NAME="claude-code-ubuntu"
 CONTAINER_NAME="claude-code-dev"
 DOCKERFILE="$SCRIPT_DIR/claude-code-ubuntu.dockerfile"
 TEMPLATE_FILE="$SCRIPT_DIR/claude.template.json"
+CREDENTIALS_FILE="$HOME/.claude/.credentials.json"
 
 # Get current user's UID, GID and username
 USER_UID=$(id -u)
@@ -55,6 +59,11 @@ USER_GID=$(id -g)
 USER_NAME=$(whoami)
 CWD=$(pwd)
 
+# Print the SHA-256 of stdin (sha256sum on Linux, shasum on macOS)
+sha256() {
+    { sha256sum 2>/dev/null || shasum -a 256; } | cut -d' ' -f1
+}
+
 # Colors for output
 GREEN='\033[0;32m'
 BLUE='\033[0;34m'
@@ -69,13 +78,28 @@ if [ ! -f "$DOCKERFILE" ]; then
     exit 1
 fi
 
-# Prepare Claude configuration files
+# Read the fingerprint the current image was built from (empty if there is no image)
+IMAGE_BUILD_SHA=$(podman image inspect "$IMAGE_NAME" --format '{{index .Config.Labels "build_sha"}}' 2>/dev/null || true)
+
+# Without an image a build is certain, so fetch the base image in the background
+# while the configuration is prepared
+PULL_PID=""
+if [ -z "$IMAGE_BUILD_SHA" ]; then
+    BASE_IMAGE=$(awk '/^FROM /{print $2; exit}' "$DOCKERFILE")
+    { podman image exists "$BASE_IMAGE" || podman pull -q "$BASE_IMAGE"; } >/dev/null 2>&1 &
+    PULL_PID=$!
+fi
+
+# Prepare Claude configuration files in a private temporary build context,
+# removed on exit even if a later step fails
 echo -e "${GREEN}Preparing Claude configuration files...${NC}"
+BUILD_CONTEXT=$(mktemp -d)
+trap 'rm -rf "$BUILD_CONTEXT"' EXIT
 
-# Copy credentials file
-if [ -f "$HOME/.claude/.credentials.json" ]; then
-    cp "$HOME/.claude/.credentials.json" "$SCRIPT_DIR/.credentials.json"
-    echo -e "${BLUE}Copied credentials file${NC}"
+# Check credentials file (passed to the build as a secret, not copied into the context)
+if [ -f "$CREDENTIALS_FILE" ]; then
+    CREDENTIALS_SHA=$(sha256 < "$CREDENTIALS_FILE")
+    echo -e "${BLUE}Found credentials file${NC}"
 else
     echo -e "${YELLOW}Warning: ~/.claude/.credentials.json not found${NC}"
     exit 1
@@ -83,17 +107,16 @@ fi
 
 # Create .claude.json from template with user's config
 if [ -f "$HOME/.claude.json" ] && [ -f "$TEMPLATE_FILE" ]; then
-    # Extract userId and oauthAccount from user's config using jq
-    USER_ID=$(jq -r '.userID // .userId // ""' "$HOME/.claude.json" 2>/dev/null || echo "")
-    OAUTH_ACCOUNT=$(jq -c '.oauthAccount // {}' "$HOME/.claude.json" 2>/dev/null || echo "{}")
-    
-    # Update template with user's data and replace $USER_NAME
-    jq --arg userId "$USER_ID" --argjson oauthAccount "$OAUTH_ACCOUNT" --arg userName "$USER_NAME" \
-       '.userID = $userId | .oauthAccount = $oauthAccount | 
+    # Update template with userId and oauthAccount from user's config and replace
+    # $USER_NAME in a single jq pass (an unparsable user config counts as empty)
+    jq --rawfile userConfig "$HOME/.claude.json" --arg userName "$USER_NAME" \
+       '((try ($userConfig | fromjson | objects) catch null) // {}) as $user |
+        .userID = ($user.userID // $user.userId // "") |
+        .oauthAccount = ($user.oauthAccount // {}) |
         .projects = (.projects | to_entries | map(
           .key |= sub("\\$USER_NAME"; $userName)
         ) | from_entries)' \
-       "$TEMPLATE_FILE" > "$SCRIPT_DIR/.claude.json"
+       "$TEMPLATE_FILE" > "$BUILD_CONTEXT/.claude.json"
     
     echo -e "${BLUE}Created .claude.json with user configuration${NC}"
 else
@@ -101,26 +124,50 @@ else
     exit 1
 fi
 
-# Build the image if it doesn't exist, if Dockerfile is newer, or if --no-cache is specified
-if [ "$NO_CACHE" = true ] || ! podman image exists "$IMAGE_NAME" || [ "$DOCKERFILE" -nt "$(podman image inspect $IMAGE_NAME --format '{{.Created}}' 2>/dev/null || echo '1970-01-01')" ]; then
+# Fingerprint everything that goes into the image: the Dockerfile, the build args,
+# the credentials and the staged configuration. The image is labelled with it at build time.
+BUILD_SHA=$( { cat "$DOCKERFILE" "$BUILD_CONTEXT/.claude.json"; \
+    echo "$USER_UID:$USER_GID:$USER_NAME:$CREDENTIALS_SHA"; } | sha256)
+
+# Stop and remove existing container in the background while the image is
+# prepared (rm --force stops a running container; --ignore tolerates a missing
+# one). Starting it after the configuration checks means a launch that fails
+# those checks leaves a running session alone, but a failed build does not.
+echo -e "${YELLOW}Stopping any existing container...${NC}"
+podman rm --force --ignore "$CONTAINER_NAME" >/dev/null 2>&1 &
+REMOVE_PID=$!
+
+# Build the image if it doesn't exist, if its inputs changed, or if --no-cache is specified.
+# A missing image yields an empty label, so the fingerprint comparison covers both.
+if [ "$NO_CACHE" = true ] || [ "$IMAGE_BUILD_SHA" != "$BUILD_SHA" ]; then
+    # A failed pre-pull is not fatal; podman build pulls the base image itself
+    if [ -n "$PULL_PID" ]; then
+        wait "$PULL_PID" || true
+    fi
+
     echo -e "${GREEN}Building Claude Code Ubuntu image...${NC}"
-    BUILD_ARGS="--build-arg USER_ID=$USER_UID --build-arg GROUP_ID=$USER_GID --build-arg USER_NAME=$USER_NAME -t $IMAGE_NAME"
+    BUILD_ARGS="--build-arg USER_ID=$USER_UID --build-arg GROUP_ID=$USER_GID --build-arg USER_NAME=$USER_NAME --layers"
     if [ "$NO_CACHE" = true ]; then
         BUILD_ARGS="$BUILD_ARGS --no-cache"
+    elif [ -n "$DOCKER_CACHE_REPO" ]; then
+        # Share the layer cache across machines through a registry repository. Only the
+        # base stage is exported: credentials and config are added by the local build
+        # below, which reuses these layers but never pushes its own.
+        echo -e "${BLUE}Using layer cache repository: $DOCKER_CACHE_REPO${NC}"
+        podman build -f "$DOCKERFILE" $BUILD_ARGS --target base \
+            --cache-from "$DOCKER_CACHE_REPO" --cache-to "$DOCKER_CACHE_REPO" "$BUILD_CONTEXT"
     fi
-    podman build -f "$DOCKERFILE" $BUILD_ARGS "$SCRIPT_DIR"
+    podman build -f "$DOCKERFILE" $BUILD_ARGS --build-arg CREDENTIALS_SHA=$CREDENTIALS_SHA \
+        -t $IMAGE_NAME --label build_sha=$BUILD_SHA \
+        --secret "id=claude_creds,src=$CREDENTIALS_FILE" "$BUILD_CONTEXT"
 fi
 
 # Clean up temporary files
 echo -e "${GREEN}Cleaning up temporary files...${NC}"
-rm -f "$SCRIPT_DIR/.credentials.json" "$SCRIPT_DIR/.claude.json"
+rm -rf "$BUILD_CONTEXT"
 
-# Stop and remove existing container if running
-if podman container exists "$CONTAINER_NAME"; then
-    echo -e "${YELLOW}Stopping existing container...${NC}"
-    podman stop "$CONTAINER_NAME" >/dev/null 2>&1 || true
-    podman rm "$CONTAINER_NAME" >/dev/null 2>&1 || true
-fi
+# Wait for the existing container to be removed
+wait "$REMOVE_PID" || true
 
 echo -e "${GREEN}Starting Claude Code container...${NC}"
 echo -e "${BLUE}Container name: $CONTAINER_NAME${NC}"
@@ -130,7 +177,7 @@ echo -e "${BLUE}Type 'claude' to start Claude Code${NC}"
 echo -e "${BLUE}Type 'exit' to stop the container${NC}"
 echo ""
 
-# Run the container
+# Run the container, replacing this shell so it does not linger for the whole session
 if [ -n "$MESSAGE" ]; then
     CLAUDE_CMD="claude"
     if [ -n "$PERMISSION_MODE" ]; then
@@ -140,7 +187,7 @@ if [ -n "$MESSAGE" ]; then
     fi
     CLAUDE_CMD="$CLAUDE_CMD -p \"$MESSAGE\" --output-format stream-json --verbose"
     echo -e "${BLUE}Running $CLAUDE_CMD after container starts...${NC}"
-    podman run -it \
+    exec podman run -it \
         --name "$CONTAINER_NAME" \
         --hostname claude-dev \
         --user "$USER_UID:$USER_GID" \
@@ -149,7 +196,7 @@ if [ -n "$MESSAGE" ]; then
         "$IMAGE_NAME" \
         bash -c "$CLAUDE_CMD"
 else
-    podman run -it \
+    exec podman run -it \
         --name "$CONTAINER_NAME" \
         --hostname claude-dev \
         --user "$USER_UID:$USER_GID" \
@@ -157,5 +204,3 @@ else
         --userns=keep-id \
         "$IMAGE_NAME"
 fi
-
-echo -e "${GREEN}Container stopped${NC}"